@@ -1,11 +1,14 @@
-import fiona
-import rasterio
-import rasterio.windows
-from typing import Iterator
+from typing import TYPE_CHECKING, Iterator
 
+if TYPE_CHECKING:
+    import fiona
+    import rasterio.windows
 
-def polygon_iterator(geometry: fiona.Geometry) -> Iterator[fiona.Geometry]:
+
+def polygon_iterator(geometry: 'fiona.Geometry') -> Iterator['fiona.Geometry']:
     """Iterates over the polygons in a geometry."""
+    import fiona
+
     if geometry.type == "Polygon":
         yield geometry
     elif geometry.type == "MultiPolygon":
@@ -18,13 +21,15 @@ def polygon_iterator(geometry: fiona.Geometry) -> Iterator[fiona.Geometry]:
             yield from polygon_iterator(geometry)
 
 
-def window_to_filename(product_name: str, window: rasterio.windows.Window) -> str:
+def window_to_filename(product_name: str, window: 'rasterio.windows.Window') -> str:
     """Encodes a product name and a window into a target or image filename."""
     return f"{product_name}_{window.width}_{window.col_off}_{window.row_off}.tif"
 
 
-def filename_to_window(filename: str) -> tuple[str, rasterio.windows.Window]:
+def filename_to_window(filename: str) -> tuple[str, 'rasterio.windows.Window']:
     """Decodes the name of a target or image file into a product name and a window."""
+    import rasterio.windows
+
     fields = filename.split("_")
     window = rasterio.windows.Window(
         int(fields[-2]), # type: ignore
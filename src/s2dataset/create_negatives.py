@@ -1,24 +1,29 @@
 import click
 import concurrent.futures as cf
-import fiona
 import random
-import rasterio
-import rasterio.windows
 from .common import window_to_filename, filename_to_window, polygon_iterator
 from pathlib import Path
-from s2utils import S2Catalog, chip_tile
+from s2utils import S2Cache, S2Catalog, chip_tile, filter_windows
 from tqdm import tqdm
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import rasterio.windows
 
 
 @click.command()
 @click.argument("root_dir", type=str)
 @click.option("--size", "-s", type=int, default=224, help="Size of the images.")
 @click.option("--stride", "-t", type=int, default=224, help="Stride of the sliding window.")
+@click.option("--cache-dir", "-c", type=str, help="Directory to cache remote files in.")
+@click.option("--cache-size", type=float, default=10, help="Maximum size of the cache in GB.")
 @click.option("--workers", "-w", type=int, default=1, help="Number of workers to use.")
 def create_negatives(
     root_dir: str,
     size: int,
     stride: int,
+    cache_dir: Optional[str],
+    cache_size: float,
     workers: int
 ) -> None:
     """Create negative samples for the dataset.
@@ -31,25 +36,44 @@ def create_negatives(
     image_dir = Path(root_dir) / "images"
     image_dir.mkdir(parents=True, exist_ok=True)
 
-    with cf.ProcessPoolExecutor(workers, initializer=init_worker) as pool:
-        futures = []
+    catalog = S2Catalog()
+    with cf.ProcessPoolExecutor(workers, initializer=init_worker, initargs=(catalog.root, cache_dir, cache_size)) as pool:
+        futures = {}
         for product_name, targets in product_targets(target_dir).items():
-            futures.append(
-                pool.submit(
-                    create_product_negatives,
-                    image_dir,
-                    product_name,
-                    size,
-                    stride,
-                    targets))
+            future = pool.submit(
+                create_product_negatives,
+                image_dir,
+                product_name,
+                size,
+                stride,
+                targets)
+            futures[future] = product_name
         
-        for _ in tqdm(cf.as_completed(futures), "Creating negatives", len(futures)):
-            pass
-
-
-def init_worker() -> None:
+        hits = misses = 0
+        failed = 0
+        for future in tqdm(cf.as_completed(futures), "Creating negatives", len(futures)):
+            exception = future.exception()
+            if exception is not None:
+                tqdm.write(f"Failed to create negatives for product {futures[future]}: {exception!r}")
+                failed += 1
+                continue
+
+            product_hits, product_misses = future.result()
+            hits += product_hits
+            misses += product_misses
+
+    if cache_dir:
+        click.echo(f"Cache hits: {hits}, misses: {misses}.")
+    if failed:
+        raise click.ClickException(f"Failed to create negatives for {failed} products, run the command again to retry them.")
+
+
+def init_worker(root: str, cache_dir: Optional[str], cache_size: float) -> None:
     global _catalog
-    _catalog = S2Catalog()
+    cache = None
+    if cache_dir:
+        cache = S2Cache(cache_dir, int(cache_size * 1e9))
+    _catalog = S2Catalog(root, cache)
 
 
 def create_product_negatives(
@@ -57,18 +81,35 @@ def create_product_negatives(
     product_name: str,
     size: int,
     stride: int,
-    positives: set[rasterio.windows.Window]
-) -> None:
+    positives: set['rasterio.windows.Window']
+) -> tuple[int, int]:
+    import rasterio
+
     product = _catalog[product_name]
 
-    existing = set()
+    # Caches are per worker, so each task reports its own hits and misses.
+    cache = product.cache
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+
+    # Negatives created with another size, or beyond the number of positives,
+    # e.g. after the targets were rebuilt, are deleted.
+    existing = {}
     for image in image_dir.glob(f"{product_name}_*.tif"):
         _, window = filename_to_window(image.stem)
-        existing.add(window)
-    existing -= positives
+        if window in positives:
+            continue
+        if window.width != size or window.height != size:
+            image.unlink()
+        else:
+            existing[window] = image
+
+    excess = len(existing) - len(positives)
+    for window in random.sample(list(existing), max(0, excess)):
+        existing.pop(window).unlink()
 
-    windows = set(chip_tile(size, stride)) - positives - existing
-    windows = random.sample(list(windows), len(positives) - len(existing))
+    windows = filter_windows(chip_tile(size, stride), product.footprint, product.transform)
+    windows = set(windows) - positives - set(existing)
+    windows = random.sample(list(windows), max(0, min(len(windows), len(positives) - len(existing))))
 
     with product as src:
         for window in windows:
@@ -87,10 +128,14 @@ def create_product_negatives(
             ) as dst:
                 dst.write(data)
 
+    if cache is None:
+        return 0, 0
+    return cache.hits - hits, cache.misses - misses
+
 
 def product_targets(
     target_dir: Path
-) -> dict[str, set[rasterio.windows.Window]]:
+) -> dict[str, set['rasterio.windows.Window']]:
     targets = {}
     for target in target_dir.glob("*.tif"):
         product_name, window = filename_to_window(target.stem)
@@ -99,6 +144,8 @@ def product_targets(
 
 
 def read_mask(mask: str):
+    import fiona
+
     with fiona.open(mask) as colxn:
         for feature in colxn:
             yield from polygon_iterator(feature.geometry)
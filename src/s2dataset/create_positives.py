@@ -1,19 +1,24 @@
 import click
 import concurrent.futures as cf
-import rasterio
-import rasterio.windows
 from .common import window_to_filename, filename_to_window
 from pathlib import Path
-from s2utils import S2Catalog
+from s2utils import S2Cache, S2Catalog
 from tqdm import tqdm
-from typing import Iterable
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:
+    import rasterio.windows
 
 
 @click.command()
 @click.argument("root_dir", type=str)
+@click.option("--cache-dir", "-c", type=str, help="Directory to cache remote files in.")
+@click.option("--cache-size", type=float, default=10, help="Maximum size of the cache in GB.")
 @click.option("--workers", "-w", type=int, default=1, help="Number of workers to use.")
 def create_positives(
     root_dir: str,
+    cache_dir: Optional[str],
+    cache_size: float,
     workers: int
 ) -> None:
     """Create positive samples for the dataset.
@@ -25,7 +30,8 @@ def create_positives(
     image_dir = Path(root_dir) / "images"
     image_dir.mkdir(parents=True, exist_ok=True)
     
-    with cf.ProcessPoolExecutor(workers, initializer=init_worker) as pool:
+    catalog = S2Catalog()
+    with cf.ProcessPoolExecutor(workers, initializer=init_worker, initargs=(catalog.root, cache_dir, cache_size)) as pool:
         futures = []
         for product_name, windows in missing_positives(image_dir, target_dir).items():
             futures.append(
@@ -35,22 +41,38 @@ def create_positives(
                     product_name,
                     windows))
 
-        for _ in tqdm(cf.as_completed(futures), "Creating positives", len(futures)):
-            pass
+        hits = misses = 0
+        for future in tqdm(cf.as_completed(futures), "Creating positives", len(futures)):
+            if future.exception() is None:
+                product_hits, product_misses = future.result()
+                hits += product_hits
+                misses += product_misses
+
+    if cache_dir:
+        click.echo(f"Cache hits: {hits}, misses: {misses}.")
 
 
-def init_worker() -> None:
+def init_worker(root: str, cache_dir: Optional[str], cache_size: float) -> None:
     global _catalog
-    _catalog = S2Catalog()
+    cache = None
+    if cache_dir:
+        cache = S2Cache(cache_dir, int(cache_size * 1e9))
+    _catalog = S2Catalog(root, cache)
 
 
 def create_product_positives(
     image_dir: Path,
     product_name: str,
-    windows: Iterable[rasterio.windows.Window]
-) -> None:
+    windows: Iterable['rasterio.windows.Window']
+) -> tuple[int, int]:
+    import rasterio
+
     product = _catalog[product_name]
 
+    # Caches are per worker, so each task reports its own hits and misses.
+    cache = product.cache
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+
     with product as src:
         for window in windows:
             data = src.read(window=window)
@@ -68,11 +90,15 @@ def create_product_positives(
             ) as dst:
                 dst.write(data)
 
+    if cache is None:
+        return 0, 0
+    return cache.hits - hits, cache.misses - misses
+
 
 def missing_positives(
     image_dir: Path,
     target_dir: Path
-) -> dict[str, set[rasterio.windows.Window]]:
+) -> dict[str, set['rasterio.windows.Window']]:
     targets = {target.stem for target in target_dir.glob("*.tif")}
     images = {image.stem for image in image_dir.glob("*.tif")}
     
@@ -1,14 +1,20 @@
 import click
 import concurrent.futures as cf
-import fiona
-import fiona.crs
-import rasterio
-from .common import window_to_filename, polygon_iterator
+import hashlib
+import json
+import os
+import shapely
+import time
+from .common import window_to_filename, filename_to_window, polygon_iterator
 from datetime import datetime
 from pathlib import Path
-from s2utils import S2Tile, S2TileIndex, S2Catalog, chip_tile, rasterize_tile
+from s2utils import S2Product, S2Tile, S2TileIndex, S2Catalog, chip_tile, filter_windows, owned_windows, rasterize_tile
 from tqdm import tqdm
-from typing import Any, Iterator, Union, Sequence
+from typing import Any, Iterable, Iterator, Optional, Union, Sequence
+
+
+# Minimum number of seconds between writes of the manifest.
+manifest_interval = 30
 
 
 @click.command()
@@ -18,6 +24,7 @@ from typing import Any, Iterator, Union, Sequence
 @click.option("--end-date", "-e", type=str, help="End date of the search.")
 @click.option("--size", "-s", type=int, default=224, help="Size of the images.")
 @click.option("--stride", "-t", type=int, default=224, help="Stride of the sliding window.")
+@click.option("--overlap", "-o", type=click.Choice(["ownership", "keep"]), default="ownership", help="How to handle windows in the overlap between tiles.")
 @click.option("--workers", "-w", type=int, default=1, help="Number of workers to use.")
 def create_targets(
     root_dir: str,
@@ -26,66 +33,193 @@ def create_targets(
     end_date: Union[datetime, str, None],
     size: int,
     stride: int,
+    overlap: str,
     workers: int
 ) -> None:
     """Create targets for the dataset.
     
     ROOT_DIR is the path to the root directory of the dataset. FEATURES is the path
     to the file containing the features.
+
+    Neighbouring tiles overlap, so by default windows in the overlap are only
+    kept by the tile that owns them. Use `--overlap keep` to keep them in
+    every tile.
+
+    Only tiles whose features or query parameters changed since the last run
+    are processed again, and targets and images that are no longer valid are
+    deleted.
     """
     target_dir = Path(root_dir) / "targets"
     target_dir.mkdir(parents=True, exist_ok=True)
 
-    with cf.ProcessPoolExecutor(workers, initializer=init_worker) as pool:
-        futures = []
+    image_dir = Path(root_dir) / "images"
+
+    manifest_path = Path(root_dir) / "targets.json"
+    manifest = read_manifest(manifest_path)
+    products = manifest_products(manifest)
+
+    catalog = S2Catalog()
+    with cf.ProcessPoolExecutor(workers, initializer=init_worker, initargs=(catalog.root,)) as pool:
         with S2TileIndex() as index:
-            for tile, geometries in index.join(read_features(features)):
-                futures.append(
-                    pool.submit(
-                        create_tile_targets,
-                        target_dir,
-                        tile,
-                        geometries,
-                        start_date,
-                        end_date,
-                        size,
-                        stride))
-
-        for _ in tqdm(cf.as_completed(futures), "Creating targets", len(futures)):
-            pass
-
-
-def init_worker() -> None:
+            joined = list(index.join(read_features(features)))
+
+        for tile_name in set(manifest) - {tile.name for tile, _ in joined}:
+            delete_chips(target_dir, image_dir, manifest.pop(tile_name)["targets"])
+        write_manifest(manifest_path, manifest)
+
+        # The product of every tile is found first, as the ownership of the
+        # overlap between tiles depends on the products of both.
+        failed = 0
+        search_futures = [
+            pool.submit(search_tile_product, tile, start_date, end_date)
+            for tile, _ in joined]
+
+        searched: set[str] = set()
+        tile_products: list[Optional[S2Product]] = []
+        for (tile, _), future in zip(joined, tqdm(search_futures, "Searching products")):
+            exception = future.exception()
+            if exception is not None:
+                tqdm.write(f"Failed to search products for tile {tile.name}: {exception!r}")
+                failed += 1
+                tile_products.append(None)
+            else:
+                searched.add(tile.name)
+                tile_products.append(future.result())
+
+        candidates = [i for i, product in enumerate(tile_products) if product is not None]
+        tree = shapely.STRtree([joined[i][0].geometry for i in candidates])
+
+        futures = {}
+        for (tile, geometries), product in zip(joined, tile_products):
+            if product is None:
+                if tile.name not in searched:
+                    continue
+
+                # Tiles without a product have no targets, and are searched
+                # again on the next run.
+                delete_chips(target_dir, image_dir, manifest.get(tile.name, {}).get("targets", []))
+                manifest[tile.name] = {"hash": None, "targets": []}
+                continue
+
+            neighbours: list[S2Product] = []
+            if overlap == "ownership":
+                for i in tree.query(tile.geometry, predicate="intersects"):
+                    neighbour = tile_products[candidates[i]]
+                    if neighbour is not None and neighbour.name != product.name:
+                        neighbours.append(neighbour)
+
+            digest = tile_hash(
+                geometries,
+                size,
+                stride,
+                product.name,
+                sorted(neighbour.name for neighbour in neighbours))
+            if manifest.get(tile.name, {}).get("hash") == digest:
+                continue
+
+            future = pool.submit(
+                create_tile_targets,
+                target_dir,
+                tile,
+                geometries,
+                product,
+                neighbours,
+                size,
+                stride)
+            futures[future] = (tile.name, product.name, digest)
+
+        # The manifest lists every target, so it is only written every
+        # `manifest_interval` seconds, and once more when the run ends or is
+        # interrupted. Tiles are only added to it once their targets are
+        # written, so an interrupted run at worst processes them again.
+        written = time.monotonic()
+        try:
+            for future in tqdm(cf.as_completed(futures), "Creating targets", len(futures)):
+                tile_name, product_name, digest = futures[future]
+
+                # Failed tiles are left out of the manifest, so they are
+                # processed again on the next run.
+                exception = future.exception()
+                if exception is not None:
+                    tqdm.write(f"Failed to create targets for tile {tile_name}: {exception!r}")
+                    failed += 1
+                    continue
+
+                targets = future.result()
+
+                stale = set(manifest.get(tile_name, {}).get("targets", [])) - set(targets)
+                delete_chips(target_dir, image_dir, stale)
+
+                # Negatives are sampled to match the positives of a product,
+                # so they are sampled again when its targets change.
+                delete_negatives(image_dir, product_name, targets)
+
+                manifest[tile_name] = {"hash": digest, "targets": sorted(targets)}
+                if time.monotonic() - written >= manifest_interval:
+                    write_manifest(manifest_path, manifest)
+                    written = time.monotonic()
+        finally:
+            write_manifest(manifest_path, manifest)
+
+    # Negatives are sampled per product, so products that are no longer used
+    # by any target leave their negatives behind.
+    for product_name in products - manifest_products(manifest):
+        for image in image_dir.glob(f"{product_name}_*.tif"):
+            image.unlink()
+
+    if failed:
+        raise click.ClickException(f"Failed to create targets for {failed} tiles, run the command again to retry them.")
+
+
+def init_worker(root: str) -> None:
     global _catalog
-    _catalog = S2Catalog()
+    _catalog = S2Catalog(root)
+
+
+def search_tile_product(
+    tile: S2Tile,
+    start_date: Union[datetime, str, None],
+    end_date: Union[datetime, str, None]
+) -> Optional[S2Product]:
+    for product in _catalog.search(
+        tile,
+        start_date=start_date,
+        end_date=end_date,
+        max_items=1,
+        sort_key="cloudcover"
+    ):
+        return product
+    return None
 
 
 def create_tile_targets(
     target_dir: Path,
     tile: S2Tile,
     geometries: Sequence[Any],
-    start_date: Union[datetime, str, None],
-    end_date: Union[datetime, str, None],
+    product: S2Product,
+    neighbours: Sequence[S2Product],
     size: int,
     stride: int
-) -> None:
+) -> list[str]:
+    import rasterio
+
     target = rasterize_tile(tile, geometries)
 
     windows = []
     for window in chip_tile(size, stride):
         if target[window.toslices()].any():
             windows.append(window)
+    windows = filter_windows(windows, product.footprint, product.transform)
+    windows = owned_windows(product, windows, neighbours)
 
-    for product in _catalog.search(
-        tile,
-        start_date=start_date,
-        end_date=end_date,
-        max_items=1,
-        sort_key="cloudcover"
-    ):
+    targets = []
+    try:
         for window in windows:
+            filename = window_to_filename(product.name, window)
+            targets.append(filename)
+
             with rasterio.open(
-                target_dir / window_to_filename(product.name, window), "w",
+                target_dir / filename, "w",
                 driver="GTiff",
                 width=window.width,
                 height=window.height,
@@ -96,9 +230,73 @@ def create_tile_targets(
                 compress="DEFLATE"
             ) as dst:
                 dst.write(target[window.toslices()], 1)
+    except BaseException:
+        # The tile is not recorded in the manifest, so targets written before
+        # the failure would never be cleaned up.
+        for filename in targets:
+            (target_dir / filename).unlink(missing_ok=True)
+        raise
+
+    return targets
+
+
+def tile_hash(geometries: Sequence[Any], *params: Any) -> str:
+    """Return a content hash of the features of a tile and the query parameters.
+
+    The hash does not depend on the order of the features.
+    """
+    digests = sorted(
+        hashlib.sha256(wkb).hexdigest()
+        for wkb in shapely.to_wkb(geometries))
+
+    digest = hashlib.sha256(json.dumps(params, default=str).encode())
+    for geometry_digest in digests:
+        digest.update(geometry_digest.encode())
+    return digest.hexdigest()
+
+
+def read_manifest(path: Path) -> dict[str, Any]:
+    if not path.exists():
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_manifest(path: Path, manifest: dict[str, Any]) -> None:
+    # Write to a temporary file first, so that an interrupted run never leaves
+    # a truncated manifest behind.
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def manifest_products(manifest: dict[str, Any]) -> set[str]:
+    products = set()
+    for entry in manifest.values():
+        for filename in entry["targets"]:
+            product_name, _ = filename_to_window(Path(filename).stem)
+            products.add(product_name)
+    return products
+
+
+def delete_chips(target_dir: Path, image_dir: Path, filenames: Iterable[str]) -> None:
+    for filename in filenames:
+        (target_dir / filename).unlink(missing_ok=True)
+        (image_dir / filename).unlink(missing_ok=True)
+
+
+def delete_negatives(image_dir: Path, product_name: str, targets: Iterable[str]) -> None:
+    keep = set(targets)
+    for image in image_dir.glob(f"{product_name}_*.tif"):
+        if image.name not in keep:
+            image.unlink()
 
 
 def read_features(path: str) -> Iterator[Any]:
+    import fiona
+    import fiona.crs
+
     with fiona.open(path) as colxn:
         if colxn.crs and colxn.crs != fiona.crs.from_epsg(4326):
             raise ValueError("The featrues must be in EPSG:4326.")
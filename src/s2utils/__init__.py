@@ -1,13 +1,47 @@
-from .tile import S2Tile, S2TileIndex
-from .product import S2Product
-from .catalog import S2Catalog
-from .utils import chip_tile, rasterize_tile
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .tile import S2Tile, S2TileIndex
+    from .product import S2Product
+    from .catalog import S2Catalog
+    from .cache import S2Cache
+    from .utils import chip_tile, filter_windows, owned_windows, rasterize_tile
 
 __all__ = [
     "S2Tile",
     "S2TileIndex",
     "S2Product",
     "S2Catalog",
+    "S2Cache",
     "chip_tile",
+    "filter_windows",
+    "owned_windows",
     "rasterize_tile",
 ]
+
+# Submodules are imported on first attribute access, so that importing
+# `s2utils` does not pull in heavy dependencies that may never be used.
+_modules = {
+    "S2Tile": ".tile",
+    "S2TileIndex": ".tile",
+    "S2Product": ".product",
+    "S2Catalog": ".catalog",
+    "S2Cache": ".cache",
+    "chip_tile": ".utils",
+    "filter_windows": ".utils",
+    "owned_windows": ".utils",
+    "rasterize_tile": ".utils",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _modules:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_modules[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,392 @@
+import bisect
+import hashlib
+import io
+import json
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Optional, Union
+
+if TYPE_CHECKING:
+    from .opener import CacheOpener
+
+
+# Number of bytes fetched when a file is first opened. The header of a
+# Sentinel-2 COG, with all its IFDs and tile offsets, is well within this.
+header_size = 65536
+
+# Segments larger than this, e.g. in files without block offsets, are read
+# directly instead of through the block cache.
+max_segment_size = 16 * 1024 * 1024
+
+# Seconds to wait for a connection, and for data once connected.
+timeout = (10, 60)
+
+# Number of times a request is retried after a connection error, a timeout or
+# a server error, with exponential backoff between attempts.
+max_retries = 5
+
+_type_sizes = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 16: 8, 17: 8, 18: 8}
+_type_formats = {1: "B", 3: "H", 4: "I", 16: "Q", 18: "Q"}
+_layout_tags = {
+    256: "width",
+    257: "height",
+    322: "tile_width",
+    323: "tile_height",
+    324: "offsets",
+    325: "byte_counts",
+    273: "offsets",
+    279: "byte_counts",
+}
+
+_session: Optional[tuple[int, Any]] = None
+
+
+class S2Cache:
+    """On-disk cache of remote Cloud-Optimized GeoTIFFs.
+
+    The cache stores the header of each file together with its parsed layout,
+    so that reopening a file does not make any remote request. The rest of
+    the file is cached block by block, and the least recently used blocks are
+    evicted when the cache grows beyond its maximum size. The hits and misses
+    of the block cache are counted in `hits` and `misses`.
+
+    Cached files are assumed to never change, as is the case for published
+    Sentinel-2 products, and are never revalidated against the server. Clear
+    the cache if a file does change.
+
+    The cache can be shared between processes without locking, as entries
+    are written to a temporary file and atomically moved into place, and the
+    modification time of a block is used as its last access time.
+    """
+
+    def __init__(self, path: Union[str, Path], max_size: Optional[int] = None) -> None:
+        """Create a new cache.
+
+        :param path: Directory of the cache. Created if it does not exist.
+        :param max_size: Maximum size of the cached blocks in bytes, or None
+            for no limit. Each process checks the size of the cache after
+            writing a sixteenth of this, so the cache may briefly exceed it.
+        """
+        self.path = Path(path)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._written = 0
+
+        (self.path / "headers").mkdir(parents=True, exist_ok=True)
+        (self.path / "blocks").mkdir(parents=True, exist_ok=True)
+
+        if self.max_size is not None:
+            self._evict()
+
+    def opener(self, uri: str) -> 'CacheOpener':
+        """Return an opener for `rasterio.open` that reads `uri` through the cache."""
+        from .opener import CacheOpener
+
+        return CacheOpener(uri, self)
+
+    def header(self, uri: str) -> tuple[dict[str, Any], bytes]:
+        """Return the metadata and header bytes of a file.
+
+        The metadata contains the size and ETag of the file, and its layout:
+        the dimensions, tile size, and block offsets and sizes of every image
+        in the file, with the full resolution image first followed by its
+        overviews.
+        """
+        path = self.path / "headers" / hashlib.sha256(uri.encode()).hexdigest()
+        try:
+            with open(path.with_suffix(".json")) as file:
+                metadata = json.load(file)
+            with open(path.with_suffix(".bin"), "rb") as file:
+                return metadata, file.read()
+        except FileNotFoundError:
+            pass
+
+        reader = _HeaderReader(uri)
+        layout = parse_layout(reader.read)
+        metadata = {
+            "uri": uri,
+            "size": reader.size,
+            "etag": reader.etag,
+            "layout": layout,
+        }
+
+        # The header is written before the metadata, so a reader that finds
+        # the metadata always finds a complete header.
+        _write_atomic(path.with_suffix(".bin"), bytes(reader.buffer))
+        _write_atomic(path.with_suffix(".json"), json.dumps(metadata).encode())
+        return metadata, bytes(reader.buffer)
+
+    def block(self, uri: str, etag: Optional[str], start: int, end: int) -> bytes:
+        """Return the bytes in `[start, end)` of a file.
+
+        :param uri: Uri of the file.
+        :param etag: ETag of the file when its header was cached, or None if
+            unknown.
+        :param start: Start of the byte range.
+        :param end: End of the byte range.
+        """
+        key = f"{uri} {start} {end} {etag}"
+        path = self.path / "blocks" / hashlib.sha256(key.encode()).hexdigest()
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            pass
+        else:
+            self.hits += 1
+            try:
+                os.utime(path)
+            except FileNotFoundError: # Evicted by another process
+                pass
+            return data
+
+        self.misses += 1
+        data = _fetch(uri, start, end)[0]
+        if len(data) == end - start:
+            _write_atomic(path, data)
+            self._written += len(data)
+
+        if self.max_size is not None and self._written >= self.max_size // 16:
+            self._evict()
+        return data
+
+    def _evict(self) -> None:
+        """Delete the least recently used blocks until the cache is within its
+        maximum size."""
+        assert self.max_size is not None
+
+        blocks = []
+        total = 0
+        for entry in os.scandir(self.path / "blocks"):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            blocks.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        blocks.sort()
+        for _, size, path in blocks:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        self._written = 0
+
+
+class CachedFile(io.RawIOBase):
+    """Read-only file-like object for a remote file, backed by an `S2Cache`."""
+
+    def __init__(self, uri: str, cache: S2Cache) -> None:
+        self.uri = uri
+        self.cache = cache
+        self.metadata, self._header = cache.header(uri)
+        self.size = self.metadata["size"]
+        self.etag = self.metadata["etag"]
+        self._position = 0
+
+        # The file after the header is split into segments at the start of
+        # every block, so each segment holds one block along with any data
+        # GDAL stores around it.
+        bounds = {len(self._header), self.size}
+        for ifd in self.metadata["layout"]["ifds"]:
+            for offset, count in zip(ifd.get("offsets", []), ifd.get("byte_counts", [])):
+                if count > 0 and len(self._header) < offset < self.size:
+                    bounds.add(offset)
+        self._bounds = sorted(bounds)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}.")
+        return self._position
+
+    def readinto(self, buffer: Any) -> int:
+        end = min(self._position + len(buffer), self.size)
+        if end <= self._position:
+            return 0
+
+        data = self._read(self._position, end)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def _read(self, start: int, end: int) -> bytes:
+        header_end = len(self._header)
+        if end <= header_end:
+            return self._header[start:end]
+
+        chunks = []
+        if start < header_end:
+            chunks.append(self._header[start:])
+            start = header_end
+
+        while start < end:
+            i = bisect.bisect_right(self._bounds, start) - 1
+            segment_start, segment_end = self._bounds[i], self._bounds[i + 1]
+            stop = min(end, segment_end)
+
+            if segment_end - segment_start > max_segment_size:
+                chunk = _fetch(self.uri, start, stop)[0]
+            else:
+                data = self.cache.block(self.uri, self.etag, segment_start, segment_end)
+                chunk = data[start - segment_start:stop - segment_start]
+
+            if not chunk:
+                break
+            chunks.append(chunk)
+            start += len(chunk)
+
+        return b"".join(chunks)
+
+
+def parse_layout(read: Callable[[int, int], bytes]) -> dict[str, Any]:
+    """Return the layout of a TIFF or BigTIFF file.
+
+    :param read: Function that returns `size` bytes from `offset` in the file,
+        called as `read(offset, size)`.
+    """
+    head = read(0, 16)
+    if head[:2] == b"II":
+        order = "<"
+    elif head[:2] == b"MM":
+        order = ">"
+    else:
+        raise ValueError("Not a TIFF file.")
+
+    (magic,) = struct.unpack(order + "H", head[2:4])
+    if magic == 42:
+        (offset,) = struct.unpack(order + "I", head[4:8])
+        count_format, entry_format, offset_format = "H", "HHII", "I"
+        end = 8
+    elif magic == 43:
+        (offset,) = struct.unpack(order + "Q", head[8:16])
+        count_format, entry_format, offset_format = "Q", "HHQQ", "Q"
+        end = 16
+    else:
+        raise ValueError("Not a TIFF file.")
+
+    count_size = struct.calcsize(order + count_format)
+    entry_size = struct.calcsize(order + entry_format)
+    offset_size = struct.calcsize(order + offset_format)
+
+    ifds: list[dict[str, Any]] = []
+    seen: set[int] = set()
+    while offset and offset not in seen:
+        seen.add(offset)
+
+        (count,) = struct.unpack(order + count_format, read(offset, count_size))
+        data = read(offset + count_size, count * entry_size + offset_size)
+        end = max(end, offset + count_size + len(data))
+
+        ifd: dict[str, Any] = {}
+        for i in range(count):
+            entry = data[i * entry_size:(i + 1) * entry_size]
+            tag, type_, n, value = struct.unpack(order + entry_format, entry)
+            size = _type_sizes.get(type_, 1) * n
+
+            # Values that fit in the entry are stored inline, all others are
+            # stored elsewhere in the header.
+            if size > offset_size:
+                end = max(end, value + size)
+            if tag not in _layout_tags or type_ not in _type_formats:
+                continue
+
+            if size > offset_size:
+                raw = read(value, size)
+            else:
+                raw = entry[entry_size - offset_size:][:size]
+            values = struct.unpack(f"{order}{n}{_type_formats[type_]}", raw)
+            ifd[_layout_tags[tag]] = list(values) if tag in (273, 279, 324, 325) else values[0]
+
+        ifds.append(ifd)
+        (offset,) = struct.unpack(order + offset_format, data[-offset_size:])
+
+    return {"header_size": end, "ifds": ifds}
+
+
+class _HeaderReader:
+    """Reads the header of a remote file, fetching more bytes as needed."""
+
+    def __init__(self, uri: str) -> None:
+        self.uri = uri
+        self.buffer, self.size, self.etag = _fetch(uri, 0, header_size)
+        self.buffer = bytearray(self.buffer)
+
+    def read(self, offset: int, size: int) -> bytes:
+        end = min(offset + size, self.size)
+        if end > len(self.buffer):
+            fetch_end = min(max(end, 2 * len(self.buffer)), self.size)
+            self.buffer += _fetch(self.uri, len(self.buffer), fetch_end)[0]
+        return bytes(self.buffer[offset:end])
+
+
+def _fetch(uri: str, start: int, end: int) -> tuple[bytes, int, Optional[str]]:
+    """Return the bytes in `[start, end)` of a remote file, together with the
+    size and ETag of the file."""
+    response = _get_session().get(uri, headers={"Range": f"bytes={start}-{end - 1}"}, timeout=timeout)
+    response.raise_for_status()
+
+    if response.status_code == 206:
+        size = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+        data = response.content
+    else:
+        # The server ignored the range and returned the whole file.
+        size = len(response.content)
+        data = response.content[start:end]
+    return data, size, response.headers.get("ETag")
+
+
+def _get_session() -> Any:
+    # Sessions keep connections alive, but must not be shared with forked
+    # processes, so each process creates its own.
+    global _session
+    if _session is None or _session[0] != os.getpid():
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False)
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(max_retries=retry))
+        session.mount("https://", HTTPAdapter(max_retries=retry))
+        _session = (os.getpid(), session)
+    return _session[1]
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -1,21 +1,49 @@
+from .cache import S2Cache
 from .tile import S2Tile
 from .product import S2Product
 from datetime import datetime
-from pystac_client import Client
-from typing import Iterator, Optional, Union
+from typing import Any, Iterator, Optional, Union
+
+
+url = "https://earth-search.aws.element84.com/v1"
 
 
 class S2Catalog:
     """Sentinel 2 catalog."""
 
-    def __init__(self) -> None:
-        """Create a new catalog."""
-        self._catalog = Client.open("https://earth-search.aws.element84.com/v1")
+    def __init__(self, root: Optional[str] = None, cache: Optional[S2Cache] = None) -> None:
+        """Create a new catalog.
+
+        The catalog does not connect to the STAC API until it is first used.
+
+        :param root: Root document of the catalog, as returned by `root`.
+            Passing a pre-fetched root document lets worker processes open the
+            catalog without a network round trip.
+        :param cache: Cache that products from this catalog read through, or
+            None to read them directly.
+        """
+        self._root = root
+        self._cache = cache
+        self._client = None
         self._sort_keys = {
             "datetime": "-properties.datetime",
             "cloudcover": "properties.eo:cloud_cover"
         }
 
+    @property
+    def root(self) -> str:
+        """Root document of the catalog."""
+        if self._root is None:
+            from pystac_client.stac_api_io import StacApiIO
+            self._root = StacApiIO().read_text(url)
+        return self._root
+
+    @property
+    def _catalog(self) -> Any:
+        if self._client is None:
+            self._client = _open_client(self.root)
+        return self._client
+
     def __getitem__(self, name: str):
         results = self._catalog.search(
             collections=["sentinel-2-l2a"],
@@ -26,7 +54,7 @@ class S2Catalog:
         )
 
         for item in results.items():
-            return S2Product.from_item(item)
+            return S2Product.from_item(item, self._cache)
 
         raise KeyError(f"Product {name} not found.")
 
@@ -76,4 +104,18 @@ class S2Catalog:
         )
 
         for item in results.items():
-            yield S2Product.from_item(item)
+            yield S2Product.from_item(item, self._cache)
+
+
+def _open_client(root: str) -> Any:
+    """Open a STAC API client from a pre-fetched root document."""
+    from pystac_client import Client
+    from pystac_client.stac_api_io import StacApiIO
+
+    class RootStacApiIO(StacApiIO):
+        def read_text(self, source: Any, *args: Any, **kwargs: Any) -> str:
+            if str(source).rstrip("/") == url:
+                return root
+            return super().read_text(source, *args, **kwargs)
+
+    return Client.open(url, stac_io=RootStacApiIO())
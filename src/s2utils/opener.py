@@ -0,0 +1,47 @@
+from .cache import CachedFile, S2Cache
+from rasterio.abc import FileContainer
+
+
+class CacheOpener(FileContainer): # type: ignore
+    """Opener for `rasterio.open` that reads a single remote file through an
+    `S2Cache`.
+
+    GDAL also probes for sidecar files, such as `.aux.xml` and `.msk` files,
+    next to the file. These are reported as missing, so that probing does
+    not make any remote request.
+    """
+
+    def __init__(self, uri: str, cache: S2Cache) -> None:
+        """Create a new opener.
+
+        :param uri: Uri of the file.
+        :param cache: Cache to read the file through.
+        """
+        self.uri = uri
+        self.cache = cache
+
+    def open(self, path: str, mode: str = "r", **kwds: object) -> CachedFile:
+        if path != self.uri or "r" not in mode:
+            raise FileNotFoundError(path)
+        return CachedFile(self.uri, self.cache)
+
+    def isfile(self, path: str) -> bool:
+        return path == self.uri
+
+    def isdir(self, path: str) -> bool:
+        return False
+
+    def ls(self, path: str) -> list[str]:
+        return []
+
+    def mtime(self, path: str) -> int:
+        return 0
+
+    def size(self, path: str) -> int:
+        if path != self.uri:
+            raise FileNotFoundError(path)
+        metadata, _ = self.cache.header(self.uri)
+        return metadata["size"]
+
+    def rm(self, path: str) -> None:
+        raise PermissionError(f"{path} is read-only.")
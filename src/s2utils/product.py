@@ -1,10 +1,14 @@
 import numpy as np
-import rasterio
-import rasterio.windows
+from .cache import S2Cache
+from .projection import crs_from_epsg, reproject
 from affine import Affine
-from pyproj import CRS
-from rasterio.enums import ColorInterp
-from typing import Any, List, Optional, Tuple, Union
+from shapely import Geometry
+from shapely.geometry import shape
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import rasterio.windows
+    from pyproj import CRS
 
 
 class S2Product:
@@ -19,8 +23,10 @@ class S2Product:
         self,
         name: str,
         uris: List[str],
-        crs: CRS,
-        offset: Tuple[int, int]
+        crs: 'CRS',
+        offset: Tuple[int, int],
+        footprint: Optional[Geometry] = None,
+        cache: Optional[S2Cache] = None
     ) -> None:
         """Create a new product.
 
@@ -31,17 +37,34 @@ class S2Product:
         :param uris: List of uris of the bands of the product.
         :param crs: Native CRS of the product.
         :param offset: Offset of the product in it's native CRS.
+        :param footprint: Footprint of the valid data of the product in it's
+            native CRS, or None if unknown.
+        :param cache: Cache to read the bands through, or None to read them
+            directly.
         """
         self.name = name
         self.uris = uris
         self.crs = crs
         self.offset = offset
+        self.footprint = footprint
+        self.cache = cache
 
         self.width = 10980
         self.height = 10980
         self.count = len(self.uris)
 
-        self.colorinterp = (
+    def __enter__(self) -> 'S2Product':
+        self.open()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None: # type: ignore
+        self.close()
+
+    @property
+    def colorinterp(self) -> Tuple[Any, ...]:
+        from rasterio.enums import ColorInterp
+
+        return (
             ColorInterp.coastal,
             ColorInterp.blue,
             ColorInterp.green,
@@ -55,28 +78,36 @@ class S2Product:
             ColorInterp.swir,
             ColorInterp.swir
         )
-
-    def __enter__(self) -> 'S2Product':
-        self.open()
-        return self
-    
-    def __exit__(self, exc_type, exc_value, traceback) -> None: # type: ignore
-        self.close()
     
     @classmethod
-    def from_item(cls, item: Any) -> 'S2Product':
-        """Create a product from a STAC item."""
+    def from_item(cls, item: Any, cache: Optional[S2Cache] = None) -> 'S2Product':
+        """Create a product from a STAC item.
+
+        :param item: The STAC item.
+        :param cache: Cache to read the bands through, or None to read them
+            directly.
+        """
+        from pyproj import CRS
+
         uris = []
         for asset in ["coastal", "blue", "green", "red", "rededge1", "rededge2", "rededge3", "nir", "nir08", "nir09", "swir16", "swir22"]:
             uris.append(item.assets[asset].href)
 
         if "proj:code" in item.properties: # New standard
-            crs = CRS.from_string(item.properties["proj:code"])
+            code = item.properties["proj:code"]
+            if code.startswith("EPSG:"):
+                crs = crs_from_epsg(int(code.removeprefix("EPSG:")))
+            else:
+                crs = CRS.from_string(code)
         elif "proj:epsg" in item.properties: # Old standard, may be deprecated
-            crs = CRS.from_epsg(item.properties["proj:epsg"])
+            crs = crs_from_epsg(item.properties["proj:epsg"])
         else:
             raise ValueError("Item does not contain a valid CRS.")
 
+        footprint = None
+        if item.geometry is not None:
+            footprint = reproject(shape(item.geometry), 4326, crs)
+
         return cls(
             name=item.properties["s2:product_uri"].removesuffix(".SAFE"),
             uris=uris,
@@ -84,7 +115,9 @@ class S2Product:
             offset=(
                 item.assets["blue"].extra_fields["proj:transform"][2],
                 item.assets["blue"].extra_fields["proj:transform"][5]
-            )
+            ),
+            footprint=footprint,
+            cache=cache
         )
 
     @property
@@ -92,13 +125,20 @@ class S2Product:
         return Affine.translation(*self.offset) * Affine.scale(10, -10)
 
     def open(self) -> None:
-        self.datasets = [rasterio.open(path) for path in self.uris]
+        import rasterio
+
+        if self.cache is None:
+            self.datasets = [rasterio.open(path) for path in self.uris]
+        else:
+            self.datasets = [rasterio.open(path, opener=self.cache.opener(path)) for path in self.uris]
 
     def close(self) -> None:
         for dataset in self.datasets:
             dataset.close()
 
-    def _read(self, index: int, window: Optional[rasterio.windows.Window] = None) -> Any:
+    def _read(self, index: int, window: Optional['rasterio.windows.Window'] = None) -> Any:
+        import rasterio.windows
+
         width = self.width
         height = self.height
 
@@ -119,7 +159,7 @@ class S2Product:
             window=window,
             boundless=True)
     
-    def read(self, indexes: Optional[Union[int, List[int]]] = None, window: Optional[rasterio.windows.Window] = None) -> Any:
+    def read(self, indexes: Optional[Union[int, List[int]]] = None, window: Optional['rasterio.windows.Window'] = None) -> Any:
         if indexes is None:
             indexes = list(range(1, self.count + 1))
 
@@ -128,5 +168,7 @@ class S2Product:
         else:
             return np.stack([self._read(index - 1, window) for index in indexes])
 
-    def window_transform(self, window: rasterio.windows.Window) -> Affine:
+    def window_transform(self, window: 'rasterio.windows.Window') -> Affine:
+        import rasterio.windows
+
         return rasterio.windows.transform(window, self.transform)
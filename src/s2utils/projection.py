@@ -0,0 +1,63 @@
+import numpy as np
+import shapely
+from functools import lru_cache
+from shapely import Geometry
+from shapely.geometry import shape
+from typing import TYPE_CHECKING, Any, Union
+
+if TYPE_CHECKING:
+    from pyproj import CRS, Transformer
+
+
+@lru_cache(maxsize=None)
+def crs_from_epsg(epsg: int) -> 'CRS':
+    """Return the CRS with the given EPSG code.
+
+    Creating a CRS is slow in pyproj, so CRSs are cached for the lifetime of
+    the process.
+    """
+    from pyproj import CRS
+
+    return CRS.from_epsg(epsg)
+
+
+@lru_cache(maxsize=None)
+def transformer(src_crs: Union[int, 'CRS'], dst_crs: Union[int, 'CRS']) -> 'Transformer':
+    """Return a transformer between two CRSs.
+
+    Transformers are cached for the lifetime of the process, and always use
+    the traditional x, y (longitude, latitude) axis order.
+
+    :param src_crs: EPSG code or CRS to transform from.
+    :param dst_crs: EPSG code or CRS to transform to.
+    """
+    from pyproj import Transformer
+
+    if isinstance(src_crs, int):
+        src_crs = crs_from_epsg(src_crs)
+    if isinstance(dst_crs, int):
+        dst_crs = crs_from_epsg(dst_crs)
+    return Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+
+def reproject(geometries: Any, src_crs: Union[int, 'CRS'], dst_crs: Union[int, 'CRS']) -> Any:
+    """Return geometries reprojected from one CRS to another.
+
+    The coordinates of all geometries are transformed in a single call, rather
+    than one geometry at a time.
+
+    :param geometries: A shapely geometry, an array of shapely geometries or
+        an iterable of objects that implement the geo interface.
+    :param src_crs: EPSG code or CRS of the geometries.
+    :param dst_crs: EPSG code or CRS to reproject into.
+    """
+    if not isinstance(geometries, (Geometry, np.ndarray)):
+        geometries = np.array([
+            geometry if isinstance(geometry, Geometry) else shape(geometry)
+            for geometry in geometries
+        ], dtype=object)
+
+    transform = transformer(src_crs, dst_crs).transform
+    return shapely.transform(
+        geometries,
+        lambda coords: np.column_stack(transform(coords[:, 0], coords[:, 1])))
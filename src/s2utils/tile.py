@@ -1,17 +1,16 @@
-import fiona
-import zstandard as zstd
 from affine import Affine
+import shapely
+from .projection import crs_from_epsg
 from importlib import resources
-from pyproj import CRS
 from shapely import Geometry, Polygon
 from shapely.geometry import shape
-from typing import Any, Iterable, Iterator, TypeVar
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
 
-
-tiles_path = str(resources.files("s2utils").joinpath("resources/s2_tiling_grid.fgb.zst"))
+if TYPE_CHECKING:
+    from pyproj import CRS
 
 
-T = TypeVar("T")
+tiles_path = str(resources.files("s2utils").joinpath("resources/s2_tiling_grid.fgb.zst"))
 
 
 class S2Tile:
@@ -21,7 +20,7 @@ class S2Tile:
         self,
         name: str,
         geometry: Polygon,
-        crs: CRS,
+        crs: 'CRS',
         offset: tuple[int, int]
     ) -> None:
         """Create a new tile.
@@ -48,7 +47,7 @@ class S2Tile:
         return cls(
             name=feature["properties"]["name"],
             geometry=shape(feature["geometry"]),
-            crs=CRS.from_epsg(feature["properties"]["epsg"]),
+            crs=crs_from_epsg(feature["properties"]["epsg"]),
             offset=(
                 feature["properties"]["xoff"],
                 feature["properties"]["yoff"]
@@ -77,6 +76,9 @@ class S2TileIndex:
         self.close()
 
     def open(self) -> None:
+        import fiona
+        import zstandard as zstd
+
         with zstd.open(tiles_path) as file:
             self._colxn = fiona.open(file)
 
@@ -99,8 +101,8 @@ class S2TileIndex:
         if not isinstance(geometry, Geometry):
             geometry = shape(geometry)
 
-        for tile_id, tile in self._colxn_invalid.items(bbox=geometry.bounds):
-            if geometry.intersects(shape(tile.geometry)):
+        for tile_id, tile in self._colxn_invalid.items(bbox=tuple(shapely.bounds(geometry))):
+            if shapely.intersects(geometry, shape(tile.geometry)):
                 yield tile_id
 
     def intersection(self, geometry: Any) -> Iterator[S2Tile]:
@@ -112,20 +114,25 @@ class S2TileIndex:
         for tile_id in self._intersection(geometry):
             yield self[tile_id]
 
-    def _join(self, geometries: Iterable[T]) -> dict[int, list[T]]:
+    def _join(self, geometries: Iterable[Any]) -> dict[int, list[Geometry]]:
         """Return id of tiles that intersect the given geometries.
         
         :param geometries: An iterable of objects that implement the geo
             interface. Geometries are assumed to be in EPSG:4326.
         """
-        tiles: dict[int, list[T]] = {}
+        tiles: dict[int, list[Geometry]] = {}
         for geometry in geometries:
+            if not isinstance(geometry, Geometry):
+                geometry = shape(geometry)
             for tile_id in self._intersection(geometry):
                 tiles.setdefault(tile_id, []).append(geometry)
         return tiles
 
-    def join(self, geometries: Iterable[T]) -> Iterator[tuple[S2Tile, list[T]]]:
+    def join(self, geometries: Iterable[Any]) -> Iterator[tuple[S2Tile, list[Geometry]]]:
         """Return tiles that intersect the given geometries.
+
+        Geometries are converted to shapely geometries once, and the tiles
+        are returned along with the converted geometries.
         
         :param geometries: An iterable of objects that implement the geo
             interface. Geometries are assumed to be in EPSG:4326.
@@ -1,22 +1,29 @@
-import rasterio
-import rasterio.features
-import rasterio.warp
-import rasterio.windows
+import numpy as np
+import shapely
+from .product import S2Product
+from .projection import reproject, transformer
 from .tile import S2Tile
-from typing import Any, Iterator
+from affine import Affine
+from shapely import Geometry
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional, Sequence
+
+if TYPE_CHECKING:
+    import rasterio.windows
 
 
 def chip_tile(
     size: int,
     stride: int,
     resolution: int = 10
-) -> Iterator[rasterio.windows.Window]:
+) -> Iterator['rasterio.windows.Window']:
     """Return an iterator over windows of a Sentinel 2 tile.
 
     :param tile: The tile to iterate over.
     :param size: The size of the windows in pixels.
     :param stride: The stride of the windows in pixels.
     """
+    import rasterio.windows
+
     tile_size = 109800 // resolution
     for col in range(0, tile_size, stride):
         for row in range(0, tile_size, stride):
@@ -24,6 +31,127 @@ def chip_tile(
                 yield rasterio.windows.Window(col, row, size, size) # type: ignore
 
 
+def filter_windows(
+    windows: Iterable['rasterio.windows.Window'],
+    footprint: Optional[Geometry],
+    transform: Affine,
+    min_coverage: float = 0.5
+) -> Iterator['rasterio.windows.Window']:
+    """Return an iterator over the windows that are covered by a footprint.
+
+    Windows are dropped before any pixel is read, so this is a cheap way of
+    skipping the empty regions at the edge of a satellite swath.
+
+    :param windows: The windows to filter.
+    :param footprint: Footprint of the valid data, in the same CRS as the
+        transform. If None, all windows are returned.
+    :param transform: The affine transformation of the product.
+    :param min_coverage: The minimum fraction of a window that must be covered
+        by the footprint.
+    """
+    import rasterio.windows
+
+    windows = list(windows)
+    if footprint is None or not windows:
+        yield from windows
+        return
+
+    bounds = np.array([rasterio.windows.bounds(window, transform) for window in windows])
+    boxes = shapely.box(*bounds.T)
+
+    shapely.prepare(footprint)
+    covered = shapely.contains(footprint, boxes)
+    partial = ~covered & shapely.intersects(footprint, boxes)
+    covered[partial] = (
+        shapely.area(shapely.intersection(boxes[partial], footprint))
+        >= min_coverage * shapely.area(boxes[partial]))
+
+    for window, is_covered in zip(windows, covered):
+        if is_covered:
+            yield window
+
+
+def owned_windows(
+    product: S2Product,
+    windows: Iterable['rasterio.windows.Window'],
+    neighbours: Sequence[S2Product],
+    samples: int = 9
+) -> Iterator['rasterio.windows.Window']:
+    """Return an iterator over the windows of a product that are not owned by
+    the products of neighbouring tiles.
+
+    Neighbouring tiles overlap, so the same ground area may be covered by
+    windows from several tiles. A point is owned by the product whose tile it
+    is furthest inside of, measured in metres in the tile's own CRS, among
+    the products with valid data around it. A window is only dropped when all
+    of it is owned by neighbours, so every point remains covered by a window
+    of its owner.
+
+    Ownership is tested on a grid of points in each window, with a margin
+    that accounts for the spacing of the grid, so a few windows along the
+    border between two owners are kept by both.
+
+    :param product: The product of the windows.
+    :param windows: The windows to filter.
+    :param neighbours: Products of the tiles that overlap the product's tile.
+    :param samples: Number of points to test along each side of a window.
+    """
+    import rasterio.windows
+
+    windows = list(windows)
+    if not neighbours or not windows:
+        yield from windows
+        return
+
+    bounds = np.array([rasterio.windows.bounds(window, product.transform) for window in windows])
+    side = np.max(bounds[:, 2] - bounds[:, 0])
+
+    # Depth is 1-Lipschitz, so no point of a window can be owned differently
+    # than its nearest test point by more than twice the distance to it. The
+    # extra percent covers the scale differences between UTM zones.
+    radius = side / (samples - 1) * np.sqrt(2) / 2
+    margin = 2.02 * radius
+
+    steps = np.linspace(0, 1, samples)
+    x = bounds[:, 0, None, None] + (bounds[:, 2] - bounds[:, 0])[:, None, None] * steps[None, :, None]
+    y = bounds[:, 1, None, None] + (bounds[:, 3] - bounds[:, 1])[:, None, None] * steps[None, None, :]
+    x, y = np.broadcast_arrays(x, y)
+    x, y = x.reshape(len(windows), -1), y.reshape(len(windows), -1)
+
+    depth = _depth(product, x, y)
+    other = np.full_like(depth, -np.inf)
+    for neighbour in neighbours:
+        nx, ny = transformer(product.crs, neighbour.crs).transform(x, y)
+
+        # Only products with valid data for a whole window around a point can
+        # own it, so their windows are never removed by `filter_windows`.
+        footprint = neighbour.footprint
+        if footprint is None:
+            footprint = shapely.box(*_extent(neighbour))
+        footprint = shapely.buffer(footprint, -(side * np.sqrt(2) + radius))
+        candidate = shapely.contains_xy(footprint, nx, ny)
+
+        other = np.where(candidate, np.maximum(other, _depth(neighbour, nx, ny)), other)
+
+    foreign = (other > depth + margin).all(axis=1)
+    for window, is_foreign in zip(windows, foreign):
+        if not is_foreign:
+            yield window
+
+
+def _extent(product: S2Product) -> tuple[float, float, float, float]:
+    """Return the bounds of a product in its native CRS."""
+    left, top = product.transform * (0, 0)
+    right, bottom = product.transform * (product.width, product.height)
+    return left, bottom, right, top
+
+
+def _depth(product: S2Product, x: Any, y: Any) -> Any:
+    """Return the distance from points to the edge of a product's extent."""
+    left, bottom, right, top = _extent(product)
+    return np.minimum.reduce([x - left, right - x, y - bottom, top - y])
+
+
 def rasterize_tile(
     tile: S2Tile,
     geometries: Any,
@@ -32,14 +160,15 @@ def rasterize_tile(
     """Return an image array with input geometries burned in.
 
     :param tile: The tile to rasterize into.
-    :param geometries: An iterable of objects that implement the geo
-            interface. Geometries are assumed to be in EPSG:4326.
+    :param geometries: An array or iterable of shapely geometries, as
+            returned by `S2TileIndex.join`. Geometries are assumed to be in
+            EPSG:4326.
     """
+    import rasterio
+    import rasterio.features
+
     size = 109800 // resolution
-    geometries = rasterio.warp.transform_geom(
-        rasterio.CRS.from_epsg(4326),
-        tile.crs,
-        geometries)
+    geometries = reproject(geometries, 4326, tile.crs)
     return rasterio.features.rasterize(
         geometries,
         out_shape=(size, size),
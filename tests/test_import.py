@@ -0,0 +1,41 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+
+# Modules that are slow to import and must only be imported when used.
+heavy_modules = ["fiona", "rasterio", "pyproj", "zstandard", "pystac_client"]
+
+# Maximum time in seconds to import a module, well below the seconds it took
+# when the heavy modules were imported eagerly.
+import_budget = 1.0
+
+
+def import_module(name: str) -> tuple[float, list[str]]:
+    """Import a module in a fresh interpreter, and return the time it took
+    and the heavy modules it imported."""
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {name}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"heavy = [m for m in {heavy_modules!r} if m in sys.modules]\n"
+        "print(json.dumps([elapsed, heavy]))\n"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    elapsed, heavy = json.loads(output)
+    return elapsed, heavy
+
+
+@pytest.mark.parametrize("name", [
+    "s2utils",
+    "s2dataset.create_targets",
+    "s2dataset.create_positives",
+    "s2dataset.create_negatives",
+])
+def test_import(name: str) -> None:
+    elapsed, heavy = import_module(name)
+    assert heavy == []
+    assert elapsed < import_budget